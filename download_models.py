@@ -1,17 +1,55 @@
 #!/usr/bin/env python3
-"""Pre-download ALL Doctr models used at runtime."""
+"""
+Pre-download ALL Doctr models used at runtime, then export det/reco to ONNX.
+
+Les predictors sont construits par ocr_worker.build_predictors(), exactement
+comme au runtime : mêmes poids, même DOCTR_CACHE_DIR, aucun re-téléchargement
+au premier démarrage du conteneur.
+"""
 import os
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
-from doctr.models import ocr_predictor
-
-# Télécharge tous les modèles y compris orientation (assume_straight_pages=False)
-print("Downloading detection + recognition models...")
-ocr_predictor(
-    det_arch="db_resnet50",
-    reco_arch="crnn_vgg16_bn",
-    pretrained=True,
-    assume_straight_pages=False,
-    straighten_pages=True,
-)
-print("All models downloaded successfully.")
\ No newline at end of file
+import numpy as np
+import torch
+
+from ocr_worker import build_predictors
+
+ONNX_DIR = os.environ.get("OCR_ONNX_DIR", "/opt/doctr-onnx")
+
+# Télécharge tous les modèles, y compris l'orientation (predictor rotated)
+print("Downloading detection + recognition + orientation models...")
+models = build_predictors()
+
+# Un passage par predictor sur une image factice : charge tous les sous-modèles
+# (classifieur d'orientation compris) et l'autotune cuDNN si GPU
+dummy = [np.zeros((224, 224, 3), dtype=np.uint8)]
+with torch.inference_mode():
+    for model in models.values():
+        model(dummy)
+print("All models downloaded successfully.")
+
+# Export ONNX (logits bruts, axe batch dynamique) — chargé par ocr_worker.py via ONNX Runtime
+def export(net, name, input_shape):
+    net.eval()
+    net.exportable = True   # forward → {"logits": ...}, sans postprocessing Python
+    path = os.path.join(ONNX_DIR, f"{name}.onnx")
+    torch.onnx.export(
+        net,
+        torch.rand((1, *input_shape), dtype=torch.float32),
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch_size"}, "logits": {0: "batch_size"}},
+        export_params=True,
+        opset_version=17,
+        do_constant_folding=True,
+    )
+    net.exportable = False
+    print(f"Exported {path}")
+
+os.makedirs(ONNX_DIR, exist_ok=True)
+model = models[True]
+det_cfg = model.det_predictor.model.cfg["input_shape"]
+reco_cfg = model.reco_predictor.model.cfg["input_shape"]
+export(model.det_predictor.model, "db_resnet50", det_cfg)
+export(model.reco_predictor.model, "crnn_vgg16_bn", reco_cfg)
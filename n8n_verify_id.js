@@ -1,5 +1,6 @@
 // ─── Noeud Code n8n ───────────────────────────────────────────────────────────
-// Contexte : microservice OCR Doctr — endpoint POST /ocr
+// Contexte : microservice OCR Doctr — endpoint POST /ocr?rotated=true
+//            (rotated=true : la CNI peut être photographiée de travers)
 // Input    : items[0].binary.data = PDF de la CNI
 //            (ou items[0].json.pdf_url si passage par URL)
 // Output   : données structurées CNI + statut de validation MRZ
@@ -4,10 +4,26 @@ OCR worker persistant — lit des requêtes JSON sur stdin, écrit des réponses
 Modèle Doctr chargé UNE SEULE FOIS au démarrage du process.
 
 Protocole :
-  stdin  → {"id": "abc", "pdf_path": "/tmp/input.pdf"}
+  stdin  → {"id": "abc", "shm_name": "ocr_abc", "shm_size": 12345, "rotated": false}
+         | {"id": "abc", "pdf_path": "/tmp/input.pdf", "rotated": false}   (une requête par ligne)
+           shm_name : segment POSIX (/dev/shm) contenant les octets du PDF, créé
+                      et supprimé par le parent Node
+           rotated=true → classifieur d'orientation + redressement (CNI, photos)
   stdout → {"id": "abc", "text": "...", "page_count": N}
+         | {"id": "abc", "shm_name": "psm_xyz", "shm_size": M, "page_count": N}
+           (requête shm et texte > 64 Ko : texte UTF-8 dans un segment que le
+            parent lit puis supprime)
          | {"id": "abc", "error": "message"}
+  stream=true dans la requête → une ligne par page dès qu'elle est prête, puis un terminateur :
+  stdout → {"id": "abc", "partial": true, "page": i, "text": "..."}   (× N)
+           {"id": "abc", "done": true, "page_count": N}
   stdout → {"ready": true}  (au démarrage, une seule fois)
+
+Les requêtes arrivées ensemble sur stdin (jusqu'à OCR_BATCH_MAX, attente max
+OCR_BATCH_WAIT_MS) sont regroupées : leurs pages passent ensemble dans les mêmes
+appels model(pages), par tranches de OCR_PAGE_CHUNK pages ; chaque requête est
+répondue dès que sa dernière page sort du modèle. Un thread de
+préchargement lit et rasterise le lot suivant pendant l'inférence du lot courant.
 """
 
 import sys
@@ -15,82 +31,1013 @@ import json
 import os
 import logging
 import traceback
-import builtins
+import select
+import contextlib
+import collections
+import hashlib
+import mmap
+import queue
+import threading
+
+try:
+    import orjson
+except ImportError:   # dev local sans orjson : stdlib, même protocole
+    orjson = None
+
+try:
+    import xxhash
+except ImportError:   # dev local sans xxhash : blake2b, plus lent mais même rôle
+    xxhash = None
+
+# ── Threads CPU ───────────────────────────────────────────────────────────────
+# Le serveur lance OCR_WORKER_COUNT workers et donne à chacun son OCR_WORKER_INDEX :
+# chaque worker prend une part disjointe des cœurs alloués au process.
+# OCR_PIN_CPUS=1 : épingle le worker sur sa part (conteneurs, voisins bruyants)
+# OCR_THREADS=N  : threads intra-op ; défaut = taille de la part
+def _cpu_slice():
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    count = max(1, int(os.environ.get("OCR_WORKER_COUNT", "1")))
+    index = int(os.environ.get("OCR_WORKER_INDEX", "0")) % count
+    per, extra = divmod(len(cpus), count)
+    if per == 0:   # plus de workers que de cœurs : un cœur chacun, partagé
+        return [cpus[index % len(cpus)]]
+    # Les cœurs restants vont aux premiers workers : aucun cœur inutilisé
+    start = index * per + min(index, extra)
+    return cpus[start:start + per + (index < extra)]
+
+CPU_SLICE = _cpu_slice()
+N_THREADS = int(os.environ.get("OCR_THREADS", "0")) or len(CPU_SLICE)
 
-# ── Tout vers stderr avant imports ────────────────────────────────────────────
-os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-os.environ["DOCTR_MULTIPROCESSING_DISABLE"] = "TRUE"
-logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+BATCH_MAX = int(os.environ.get("OCR_BATCH_MAX", "8"))
+BATCH_WAIT_MS = int(os.environ.get("OCR_BATCH_WAIT_MS", "5"))
+PAGE_SEP = "\n\n--- PAGE BREAK ---\n\n"
+RENDER_DPI = int(os.environ.get("OCR_RENDER_DPI", "144"))   # ≈ scale=2 de DocumentFile.from_pdf
+PAGE_CHUNK = int(os.environ.get("OCR_PAGE_CHUNK", "8"))    # pages par appel modèle (granularité du streaming)
+BLANK_DELTA = int(os.environ.get("OCR_BLANK_DELTA", "64"))   # écart à la médiane de la page au-delà duquel un pixel est de l'« encre »
+BLANK_INK = float(os.environ.get("OCR_BLANK_INK", "0.00002"))   # fraction d'encre jusqu'à laquelle la page est blanche ; 0 = désactivé
+PAGE_SLOTS = int(os.environ.get("OCR_PAGE_SLOTS", "16"))   # images de page pré-allouées (0 = désactivé)
+PAGE_SLOT_BYTES = int(os.environ.get("OCR_PAGE_SLOT_MB", "8")) * 1024 * 1024   # A4/Letter à 144 dpi ≈ 6 Mo
+PREFETCH_DEPTH = int(os.environ.get("OCR_PREFETCH_DEPTH", "2"))   # lots rasterisés d'avance
+SHM_TEXT_THRESHOLD = 64 * 1024   # au-delà, le texte de réponse passe par shared memory
+WARMUP_SIZE = (2, 1024, 1024)   # (B, H, W) du batch factice de warmup
+# Backend des réseaux det/reco :
+#   onnx  (défaut) : ONNX Runtime sur les exports de download_models.py ; exports
+#                    ou onnxruntime absents → repli sur torch
+#   torch          : PyTorch, avec OCR_INT8_RECO et OCR_COMPILE (ignorés sous onnx)
+BACKEND = os.environ.get("OCR_BACKEND", "onnx")
+ONNX_DIR = os.environ.get("OCR_ONNX_DIR", "/opt/doctr-onnx")
+# Backend torch : reconnaisseur quantifié int8 (CPU uniquement), puis torch.compile
+INT8_RECO = os.environ.get("OCR_INT8_RECO", "1") == "1"
+COMPILE = os.environ.get("OCR_COMPILE", "1") == "1"
+AUTOCAST = os.environ.get("OCR_AUTOCAST", "1") == "1"
+# Predictors construits picklés ici pour les redémarrages suivants ; "" pour désactiver.
+# Chargé avec torch.load(weights_only=False) : répertoire propre au service, jamais /tmp
+PREDICTOR_CACHE = os.environ.get(
+    "OCR_PREDICTOR_CACHE",
+    os.path.join(os.environ.get("DOCTR_CACHE_DIR", os.path.expanduser("~/.cache/doctr")), "predictors.pt"),
+)
+RESULT_CACHE_SIZE = int(os.environ.get("OCR_RESULT_CACHE", "256"))   # entrées LRU ; 0 = désactivé
 
-_orig_print = builtins.print
-def _stderr_print(*args, **kwargs):
-    kwargs.setdefault("file", sys.stderr)
-    _orig_print(*args, **kwargs)
-builtins.print = _stderr_print
+# ── Process worker ────────────────────────────────────────────────────────────
+
+_json_out = None   # copie privée du stdout d'origine, ouverte par setup_process()
+
+def setup_process():
+    """
+    Effets de bord réservés au process worker (pas à un simple import, cf.
+    download_models.py), à faire avant tout import de torch.
+    """
+    global _json_out
+    # FD 1 est redirigé sur stderr au niveau noyau : print, tqdm et les écritures C
+    # (libtorch, OpenBLAS…) ne peuvent plus corrompre le flux JSON, qui passe par
+    # une copie privée du stdout d'origine.
+    _json_out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+    os.environ["DOCTR_MULTIPROCESSING_DISABLE"] = "TRUE"
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+    # MKL/OpenMP lisent ces variables à l'init
+    if os.environ.get("OCR_PIN_CPUS", "0") == "1" and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(CPU_SLICE))
+    os.environ.setdefault("OMP_NUM_THREADS", str(N_THREADS))
+    os.environ.setdefault("MKL_NUM_THREADS", str(N_THREADS))
+
+_emit_lock = threading.Lock()   # thread principal + thread de préchargement
 
 def emit(obj):
-    _orig_print(json.dumps(obj, ensure_ascii=False), file=sys.stdout, flush=True)
+    line = orjson.dumps(obj) if orjson is not None else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    with _emit_lock:
+        _json_out.write(line + b"\n")
+        _json_out.flush()
+
+def parse_request(raw_line):
+    return orjson.loads(raw_line) if orjson is not None else json.loads(raw_line)
 
 # ── Chargement modèle ─────────────────────────────────────────────────────────
 
 def load_model():
-    _orig_print(f"[worker pid={os.getpid()}] Loading Doctr model...", file=sys.stderr, flush=True)
+    """
+    Deux predictors :
+      - models[False] : pages supposées droites (PDF natifs) — pas de classifieur
+        d'orientation ni de redressement, chemin rapide par défaut
+      - models[True]  : config complète (CNI, photos) — orientation + straighten
+    La reconnaissance est identique dans les deux cas : une seule instance partagée.
+    """
+    if BACKEND not in ("onnx", "torch"):
+        raise ValueError(f"OCR_BACKEND must be onnx or torch, got {BACKEND!r}")
+    print(f"[worker pid={os.getpid()}] Loading Doctr model...", file=sys.stderr, flush=True)
+    # fork AVANT l'import de torch : enfants légers, pas de threads OpenMP hérités
+    _start_pdf_pool()
+    import torch
+    torch.set_num_threads(N_THREADS)
+    torch.set_num_interop_threads(1)
+    # Aucun backward dans ce process ; inference_mode() couvre en plus chaque appel modèle
+    # (thread-local : vaut pour le thread principal, qui fait toute l'inférence)
+    torch.set_grad_enabled(False)
     from doctr.io import DocumentFile
+    models = _load_cached_predictors()
+    if models is None:
+        models = build_predictors()
+        _save_cached_predictors(models)
+
+    predictors = _predictors(models)
+    _use_device_ctc(predictors)
+    if not (BACKEND == "onnx" and _use_onnx(predictors)):
+        if INT8_RECO:
+            _quantize_reco(predictors)
+        if COMPILE:
+            _compile(predictors)
+    for model in models.values():
+        _warmup(model)
+    print(f"[worker pid={os.getpid()}] Ready.", file=sys.stderr, flush=True)
+    return models, DocumentFile
+
+# Arguments ocr_predictor() : architectures communes, puis par mode rotated
+PREDICTOR_ARGS = dict(det_arch="db_resnet50", reco_arch="crnn_vgg16_bn", pretrained=True)
+PREDICTOR_MODES = {
+    False: dict(assume_straight_pages=True, straighten_pages=False),
+    True: dict(assume_straight_pages=False, straighten_pages=True),
+}
+
+def build_predictors():
     from doctr.models import ocr_predictor
-    model = ocr_predictor(
-        det_arch="db_resnet50",
-        reco_arch="crnn_vgg16_bn",
-        pretrained=True,
-        assume_straight_pages=False,
-        straighten_pages=True,
-    )
-    _orig_print(f"[worker pid={os.getpid()}] Ready.", file=sys.stderr, flush=True)
-    return model, DocumentFile
+    models = {rotated: ocr_predictor(**PREDICTOR_ARGS, **mode) for rotated, mode in PREDICTOR_MODES.items()}
+    models[False].reco_predictor = models[True].reco_predictor
+    return models
+
+def _cache_key():
+    import torch
+    import doctr
+    return (torch.__version__, doctr.__version__, repr(PREDICTOR_ARGS), repr(PREDICTOR_MODES))
+
+def _cache_file_trusted(path):
+    """Pickle chargé seulement s'il appartient à l'utilisateur du worker et n'est modifiable que par lui."""
+    st = os.stat(path)
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+def _load_cached_predictors():
+    """Predictors picklés par un démarrage précédent (avant ONNX/compile) ; None si absent ou périmé."""
+    if not PREDICTOR_CACHE or not os.path.isfile(PREDICTOR_CACHE):
+        return None
+    if not _cache_file_trusted(PREDICTOR_CACHE):
+        print(f"[worker] {PREDICTOR_CACHE} not owned by this user or group/world-writable, ignored",
+              file=sys.stderr, flush=True)
+        return None
+    import torch
+    try:
+        cached = torch.load(PREDICTOR_CACHE, map_location="cpu", weights_only=False)
+        if cached.get("key") != _cache_key():
+            return None
+        print(f"[worker pid={os.getpid()}] Predictors loaded from {PREDICTOR_CACHE}", file=sys.stderr, flush=True)
+        return cached["models"]
+    except Exception as e:
+        print(f"[worker] predictor cache unusable ({e}), rebuilding", file=sys.stderr, flush=True)
+        return None
+
+def _save_cached_predictors(models):
+    if not PREDICTOR_CACHE:
+        return
+    import torch
+    # Écriture atomique : plusieurs workers démarrent en parallèle
+    tmp_path = f"{PREDICTOR_CACHE}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(PREDICTOR_CACHE) or ".", exist_ok=True)
+        torch.save({"key": _cache_key(), "models": models}, tmp_path)
+        os.replace(tmp_path, PREDICTOR_CACHE)
+    except Exception as e:
+        print(f"[worker] predictor cache not written: {e}", file=sys.stderr, flush=True)
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+
+def _predictors(models):
+    """(det, reco) predictors distincts, sans doublon pour les instances partagées."""
+    det, reco = {}, {}
+    for model in models.values():
+        det[id(model.det_predictor)] = model.det_predictor
+        reco[id(model.reco_predictor)] = model.reco_predictor
+    return list(det.values()), list(reco.values())
+
+def _compile(predictors):
+    """
+    torch.compile des réseaux détection + reconnaissance (pas des pré/post-processeurs).
+    Inductor ne compile qu'au premier appel : chaque module est essayé ici sur une
+    entrée factice, et reste en eager si la compilation échoue (pas de compilateur C++…).
+    """
+    import torch
+    if not hasattr(torch, "compile"):
+        return
+    det, reco = predictors
+    for predictor in det + reco:
+        eager = predictor.model
+        if getattr(eager, "is_int8", False):
+            continue
+        compiled = torch.compile(eager, mode="reduce-overhead", fullgraph=False)
+        try:
+            with inference_ctx():
+                compiled(torch.zeros((1, *eager.cfg["input_shape"])))
+        except Exception as e:
+            print(f"[worker] torch.compile unusable for {type(eager).__name__}, eager kept: {e}",
+                  file=sys.stderr, flush=True)
+            continue
+        predictor.model = compiled
+
+# ── Décodage CTC ──────────────────────────────────────────────────────────────
+
+class DeviceCTCDecoder:
+    """
+    Remplace le CTCPostProcessor Doctr : argmax, fusion des répétitions et retrait
+    du blank restent sur le device des logits ; une seule copie D→H d'entiers
+    [B, T] au lieu d'un .tolist() + groupby Python par séquence.
+    """
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.blank = len(vocab)
+
+    def __call__(self, logits):
+        import torch
+        probs = torch.softmax(logits.float(), dim=-1).amax(dim=-1).amin(dim=1)
+        idx = logits.argmax(dim=-1)
+        keep = idx != self.blank
+        keep[:, 1:] &= idx[:, 1:] != idx[:, :-1]
+        seqs = idx.masked_fill(~keep, -1).tolist()
+        vocab = self.vocab
+        words = ["".join(vocab[i] for i in seq if i >= 0) for seq in seqs]
+        return list(zip(words, probs.tolist()))
+
+def _use_device_ctc(predictors):
+    _, reco = predictors
+    for predictor in reco:
+        predictor.model.postprocessor = DeviceCTCDecoder(predictor.model.postprocessor.vocab)
+
+# ── Quantification ────────────────────────────────────────────────────────────
+
+def _quantize_reco(predictors):
+    """
+    INT8 dynamique (poids int8, activations quantifiées à la volée) sur le
+    reconnaisseur PyTorch, CPU uniquement : Linear + LSTM, seules couches que
+    quantize_dynamic prend en charge. Le détecteur reste en fp32/bf16.
+
+    Les kernels int8 dynamiques (fbgemm) n'acceptent que du float32 : le forward
+    du reconnaisseur quantifié tourne hors autocast, entrée recastée en fp32.
+    Essai immédiat sous inference_ctx() ; en cas d'échec, le fp32 est conservé.
+    """
+    import torch
+    if torch.cuda.is_available():
+        return
+    _, reco = predictors
+    for predictor in reco:
+        fp32 = predictor.model
+        int8 = torch.ao.quantization.quantize_dynamic(
+            fp32, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=False,
+        )
+        _disable_autocast(int8)
+        int8.is_int8 = True
+        try:
+            with inference_ctx():
+                int8(torch.zeros((1, *fp32.cfg["input_shape"])))
+        except Exception as e:
+            print(f"[worker] int8 recognizer unusable, fp32 kept: {e}", file=sys.stderr, flush=True)
+            continue
+        predictor.model = int8
+
+def _disable_autocast(module):
+    import torch
+    forward = module.forward
+
+    def fp32_forward(x, *args, **kwargs):
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            return forward(x.float(), *args, **kwargs)
+
+    module.forward = fp32_forward
+
+# ── ONNX Runtime ──────────────────────────────────────────────────────────────
+
+def _make_ort_model_cls():
+    """
+    Adaptateurs qui remplacent le nn.Module Doctr dans son predictor : même appel
+    model(batch, return_preds=..., return_model_output=...), mais le réseau
+    tourne dans une session ORT. Le postprocessor Doctr d'origine est réutilisé.
+    """
+    import torch
+    from torch import nn
+
+    class _OrtModel(nn.Module):
+        def __init__(self, session, torch_model):
+            super().__init__()
+            self.__dict__["_torch_model"] = torch_model   # hors _modules : pas de poids dupliqués
+            self._session = session
+            self._input = session.get_inputs()[0].name
+            # Les predictors Doctr lisent next(model.parameters()) pour device/dtype
+            self._anchor = nn.Parameter(torch.empty(0), requires_grad=False)
+
+        def __getattr__(self, name):
+            try:
+                return super().__getattr__(name)
+            except AttributeError:
+                return getattr(self.__dict__["_torch_model"], name)
+
+        def _logits(self, x):
+            x = x.detach().float().cpu().numpy()
+            return torch.from_numpy(self._session.run(None, {self._input: x})[0])
+
+    class OrtDetModel(_OrtModel):
+        def forward(self, x, target=None, return_model_output=False, return_preds=False, **kwargs):
+            prob_map = torch.sigmoid(self._logits(x))
+            out = {}
+            if return_model_output:
+                out["out_map"] = prob_map
+            if target is None or return_preds:
+                out["preds"] = [
+                    dict(zip(self.class_names, preds))
+                    for preds in self.postprocessor(prob_map.permute((0, 2, 3, 1)).numpy())
+                ]
+            return out
+
+    class OrtRecoModel(_OrtModel):
+        def forward(self, x, target=None, return_model_output=False, return_preds=False, **kwargs):
+            logits = self._logits(x)
+            out = {}
+            if return_model_output:
+                out["out_map"] = logits
+            if target is None or return_preds:
+                out["preds"] = self.postprocessor(logits)
+            return out
+
+    return OrtDetModel, OrtRecoModel
+
+def _ort_session(path):
+    import onnxruntime as ort
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.intra_op_num_threads = N_THREADS
+    return ort.InferenceSession(path, sess_options, providers=ort.get_available_providers())
+
+def _use_onnx(predictors):
+    """
+    Bascule det/reco sur ONNX Runtime si les exports existent et que onnxruntime
+    est installé. False → les predictors restent en PyTorch.
+    """
+    det_path = os.path.join(ONNX_DIR, "db_resnet50.onnx")
+    reco_path = os.path.join(ONNX_DIR, "crnn_vgg16_bn.onnx")
+    if not (os.path.isfile(det_path) and os.path.isfile(reco_path)):
+        print(f"[worker] exports ONNX absents de {ONNX_DIR}, PyTorch utilisé", file=sys.stderr, flush=True)
+        return False
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        print("[worker] onnxruntime absent, PyTorch utilisé", file=sys.stderr, flush=True)
+        return False
+    OrtDetModel, OrtRecoModel = _make_ort_model_cls()
+    det, reco = predictors
+    # Mêmes poids pour tous les détecteurs : une session, postprocessor propre à chacun
+    det_session, reco_session = _ort_session(det_path), _ort_session(reco_path)
+    for predictor in det:
+        predictor.model = OrtDetModel(det_session, predictor.model)
+    for predictor in reco:
+        predictor.model = OrtRecoModel(reco_session, predictor.model)
+    print(f"[worker pid={os.getpid()}] ONNX Runtime enabled ({ONNX_DIR})", file=sys.stderr, flush=True)
+    return True
+
+def _bf16_supported():
+    import torch
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+def inference_ctx():
+    """inference_mode + autocast bf16 si le matériel le supporte (AVX512-BF16 / Ampere+)."""
+    import torch
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode())
+    if AUTOCAST and _bf16_supported():
+        device_type = "cuda" if torch.cuda.is_available() else "cpu"
+        stack.enter_context(torch.autocast(device_type=device_type, dtype=torch.bfloat16))
+    return stack
+
+def _warmup(model):
+    """cuDNN autotune, compilation des kernels et allocations avant le premier vrai batch."""
+    import numpy as np
+    import torch
+    torch.backends.cudnn.benchmark = True
+    b, h, w = WARMUP_SIZE
+    with inference_ctx():
+        model([np.zeros((h, w, 3), dtype=np.uint8) for _ in range(b)])
+        # Pages vides → aucun mot détecté : la reconnaissance (int8, compile,
+        # autocast) doit être exercée à part
+        model.reco_predictor([np.zeros((32, 128, 3), dtype=np.uint8) for _ in range(b)])
+
+# ── Sources PDF : chemin ou shared memory ─────────────────────────────────────
+
+# Un PDF est désigné soit par un chemin (str), soit par un ShmRef
+ShmRef = collections.namedtuple("ShmRef", "name size")
+
+def request_source(req):
+    if "shm_name" in req:
+        return ShmRef(req["shm_name"], int(req["shm_size"]))
+    return req["pdf_path"]
+
+def _untrack(shm):
+    # Python < 3.13 suit aussi les segments simplement ouverts et les supprimerait
+    # à la sortie : le propriétaire est le parent Node.
+    from multiprocessing import resource_tracker
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+@contextlib.contextmanager
+def _shm_view(ref):
+    """Octets du segment sans copie ; la vue n'est plus utilisable après le with."""
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=ref.name)
+    view = shm.buf[:ref.size]
+    try:
+        yield view
+    finally:
+        view.release()
+        shm.close()
+        _untrack(shm)
+
+def _read_shm(ref):
+    with _shm_view(ref) as view:
+        return bytes(view)
+
+def _write_shm(data):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    shm.close()
+    _untrack(shm)
+    return shm.name
+
+def _pdf_input(src):
+    """Argument accepté par DocumentFile.from_pdf : chemin ou octets."""
+    return _read_shm(src) if isinstance(src, ShmRef) else src
+
+def _fitz_open(src):
+    import fitz
+    if isinstance(src, ShmRef):
+        return fitz.open(stream=_read_shm(src), filetype="pdf")
+    return fitz.open(src)
+
+def result_message(req_id, text, page_count, via_shm):
+    data = text.encode("utf-8") if via_shm else None
+    if data is not None and len(data) > SHM_TEXT_THRESHOLD:
+        try:
+            return {"id": req_id, "shm_name": _write_shm(data), "shm_size": len(data), "page_count": page_count}
+        except OSError as e:   # /dev/shm plein : le texte repasse par stdout
+            print(f"[worker] shm reply failed ({e}), text sent inline", file=sys.stderr, flush=True)
+    return {"id": req_id, "text": text, "page_count": page_count}
+
+# ── Rasterisation PDF (PyMuPDF, pool de processus) ────────────────────────────
+
+class PageSlots:
+    """
+    Images de page pré-allouées dans une mmap anonyme partagée, créée avant le
+    fork du pool : l'enfant copie le pixmap PyMuPDF (samples_mv, sans copie
+    intermédiaire) dans un slot, le parent le lit en vue numpy — ni pickle, ni
+    allocation par page. Les slots sont rendus après l'inférence et réutilisés.
+    """
+
+    def __init__(self, count, slot_bytes):
+        self.slot_bytes = slot_bytes
+        self._buf = mmap.mmap(-1, count * slot_bytes)
+        self._free = list(range(count))
+        self._lock = threading.Lock()   # prefetch acquiert, thread principal libère
+
+    def acquire(self):
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, slots):
+        with self._lock:
+            self._free.extend(s for s in slots if s is not None)
+
+    def write(self, slot, samples):
+        """Côté enfant. False si la page ne tient pas dans un slot."""
+        if len(samples) > self.slot_bytes:
+            return False
+        offset = slot * self.slot_bytes
+        self._buf[offset:offset + len(samples)] = samples
+        return True
+
+    def view(self, slot, height, width):
+        import numpy as np
+        return np.frombuffer(
+            self._buf, dtype=np.uint8, count=height * width * 3, offset=slot * self.slot_bytes,
+        ).reshape(height, width, 3)
+
+_pdf_pool = None
+_page_slots = None
+
+def _start_pdf_pool():
+    """Pool de rasterisation ; sans PyMuPDF on retombe sur DocumentFile.from_pdf."""
+    global _pdf_pool, _page_slots
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        print("[worker] PyMuPDF absent, DocumentFile.from_pdf utilisé", file=sys.stderr, flush=True)
+        return
+    import multiprocessing
+    if PAGE_SLOTS > 0:
+        _page_slots = PageSlots(PAGE_SLOTS, PAGE_SLOT_BYTES)
+    # Rasterisation et inférence alternent : la moitié de la part du worker suffit.
+    # fork explicite : les enfants héritent de _page_slots et de sa mmap anonyme
+    # (ni spawn ni forkserver ne la partageraient ; défaut Linux ≠ fork dès 3.14)
+    _pdf_pool = multiprocessing.get_context("fork").Pool(processes=max(1, N_THREADS // 2))
+
+_child_doc = None   # (clé, fitz.Document) : dernier PDF ouvert par cet enfant du pool
+
+def _child_open(src):
+    """
+    Côté enfant : le PDF est ouvert (copie shm + parsing) une fois, puis réutilisé
+    pour toutes les pages de la même source qui tombent sur cet enfant. Seul le
+    dernier reste ouvert. Un chemin est identifié avec sa date et sa taille, un
+    nom de fichier temporaire pouvant resservir.
+    """
+    global _child_doc
+    if isinstance(src, ShmRef):
+        key = src
+    else:
+        st = os.stat(src)
+        key = (src, st.st_mtime_ns, st.st_size)
+    if _child_doc is None or _child_doc[0] != key:
+        if _child_doc is not None:
+            _child_doc[1].close()
+            _child_doc = None
+        _child_doc = (key, _fitz_open(src))
+    return _child_doc[1]
+
+def _render_page(src, page_idx, slot):
+    """Page rendue dans le slot → (height, width) ; sinon (pas de slot, trop grande) → tableau numpy."""
+    import fitz
+    import numpy as np
+    pix = _child_open(src)[page_idx].get_pixmap(dpi=RENDER_DPI, colorspace=fitz.csRGB, alpha=False)
+    if slot is not None and _page_slots.write(slot, pix.samples_mv):
+        return pix.height, pix.width
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+
+def _render_task(args):
+    return _render_page(*args)
+
+def _page_count(src):
+    with _fitz_open(src) as doc:
+        return doc.page_count
+
+def load_pdfs(DocumentFile, srcs):
+    """
+    Pages (np.uint8 HxWx3) de chaque PDF, rasterisées en parallèle.
+    Retourne (docs, slots) : docs aligné sur srcs (liste de pages ou Exception),
+    slots à rendre via release_slots() une fois l'inférence terminée.
+    """
+    if _pdf_pool is None:
+        docs = []
+        for src in srcs:
+            try:
+                docs.append(DocumentFile.from_pdf(_pdf_input(src)))
+            except Exception as e:
+                docs.append(e)
+        return docs, []
+
+    # Tout est soumis d'abord, puis récupéré : les PDF se rasterisent en même temps
+    jobs, slots = [], []
+    for src in srcs:
+        try:
+            tasks = []
+            for i in range(_page_count(src)):
+                slot = _page_slots.acquire() if _page_slots is not None else None
+                slots.append(slot)
+                tasks.append((src, i, slot))
+            jobs.append((tasks, _pdf_pool.map_async(_render_task, tasks)))
+        except Exception as e:
+            jobs.append(e)
+    docs = []
+    for job in jobs:
+        try:
+            if isinstance(job, Exception):
+                raise job
+            tasks, result = job
+            docs.append([_page_image(slot, page) for (_, _, slot), page in zip(tasks, result.get())])
+        except Exception as e:
+            docs.append(e)
+    return docs, [s for s in slots if s is not None]
+
+def release_slots(slots):
+    if _page_slots is not None and slots:
+        _page_slots.release(slots)
+
+def _page_image(slot, page):
+    """Résultat de _render_page → image : vue sur le slot, ou tableau renvoyé tel quel."""
+    return _page_slots.view(slot, *page) if isinstance(page, tuple) else page
+
+class PageStream:
+    """
+    Pages d'une requête seule, remises au thread principal par tranches de
+    PAGE_CHUNK au fil de la rasterisation (imap) : l'inférence de la première
+    tranche démarre sans attendre la fin du document.
+    File : (images, slots) × N, éventuellement l'Exception de rasterisation,
+    puis TOUJOURS None en dernier : drain() peut donc vider la file sans bloquer.
+    """
+
+    def __init__(self):
+        self._chunks = queue.Queue()
+
+    def produce(self, src):
+        """Côté thread de préchargement ; bloque jusqu'à la dernière page rendue."""
+        tasks, sent = [], 0
+        try:
+            for i in range(_page_count(src)):
+                slot = _page_slots.acquire() if _page_slots is not None else None
+                tasks.append((src, i, slot))
+            chunk = []
+            for (_, _, slot), page in zip(tasks, _pdf_pool.imap(_render_task, tasks)):
+                chunk.append(_page_image(slot, page))
+                if len(chunk) == PAGE_CHUNK:
+                    self._chunks.put((chunk, [t[2] for t in tasks[sent:sent + len(chunk)]]))
+                    sent += len(chunk)
+                    chunk = []
+            if chunk:
+                self._chunks.put((chunk, [t[2] for t in tasks[sent:]]))
+                sent = len(tasks)
+        except Exception as e:
+            release_slots([t[2] for t in tasks[sent:]])
+            self._chunks.put(e)
+        finally:
+            self._chunks.put(None)
+
+    def __iter__(self):
+        """Côté thread principal : tranches d'images ; slots rendus après chaque tranche."""
+        while True:
+            item = self._chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            images, slots = item
+            try:
+                yield images
+            finally:
+                release_slots(slots)
+
+    def drain(self):
+        """Après une erreur : vide la file jusqu'au None final et rend les slots restants."""
+        while True:
+            item = self._chunks.get()
+            if item is None:
+                return
+            if not isinstance(item, Exception):
+                release_slots(item[1])
 
 # ── OCR ───────────────────────────────────────────────────────────────────────
 
-def ocr_pdf(model, DocumentFile, pdf_path):
-    doc = DocumentFile.from_pdf(pdf_path)
-    page_count = len(doc)
-    result = model(doc)
+def _page_text(page):
+    # export() : dict plat, accès par clé plutôt que par attribut sur chaque mot
+    return "\n".join(
+        " ".join(w["value"] for w in line["words"])
+        for block in page.export()["blocks"]
+        for line in block["lines"]
+    )
+
+def _join_pages(pages_text):
+    return PAGE_SEP.join(pages_text).strip()
+
+def _infer(model, images):
+    with inference_ctx():
+        return model(images).pages
+
+def _is_blank(image):
+    """
+    Page blanche : presque aucun pixel à plus de BLANK_DELTA niveaux de la médiane
+    (le fond). Le grain de scan et le bruit JPEG restent sous BLANK_DELTA ; quelques
+    poussières restent sous BLANK_INK (≈ 40 pixels d'une page A4 à 144 dpi), alors
+    que le moindre mot en compte des centaines. Tous les pixels sont comptés : pas
+    de sous-échantillonnage qui sauterait un texte clairsemé. Texte clair sur fond
+    sombre compris : l'écart est compté dans les deux sens.
+    """
+    if BLANK_INK <= 0:
+        return False
+    import numpy as np
+    # Canal vert ≈ luminance ; histogramme 256 niveaux : médiane et encre en un passage
+    cum = np.cumsum(np.bincount(image[..., 1].ravel(), minlength=256))
+    total = int(cum[-1])
+    median = int(np.searchsorted(cum, (total + 1) // 2))
+    below, above = median - BLANK_DELTA, median + BLANK_DELTA
+    ink = (int(cum[below - 1]) if below > 0 else 0) + (total - int(cum[above]) if above < 255 else 0)
+    return ink <= BLANK_INK * total
+
+def _infer_texts(model, images):
+    """Texte de chaque image ; les pages blanches valent "" et ne passent pas par le modèle."""
+    texts = [""] * len(images)
+    todo = [i for i, image in enumerate(images) if not _is_blank(image)]
+    if todo:
+        for i, page in zip(todo, _infer(model, [images[i] for i in todo])):
+            texts[i] = _page_text(page)
+    return texts
+
+def ocr_pages(model, chunks, on_page=None):
+    """
+    Texte de chaque page, dans l'ordre, à partir de tranches d'images
+    (PageStream, ou découpage d'une liste par _chunked). on_page(index, text)
+    est appelé dès qu'une tranche sort du modèle, sans attendre la fin du document.
+    """
     pages_text = []
-    for page in result.pages:
-        lines = []
-        for block in page.blocks:
-            for line in block.lines:
-                lines.append(" ".join(w.value for w in line.words))
-        pages_text.append("\n".join(lines))
-    full_text = "\n\n--- PAGE BREAK ---\n\n".join(pages_text).strip()
-    return full_text, page_count
+    for images in chunks:
+        for text in _infer_texts(model, images):
+            if on_page is not None:
+                on_page(len(pages_text), text)
+            pages_text.append(text)
+    return pages_text
+
+def _chunked(images):
+    return (images[start:start + PAGE_CHUNK] for start in range(0, len(images), PAGE_CHUNK))
+
+def ocr_batch(model, docs, on_page=None, on_doc=None):
+    """
+    OCR de plusieurs PDF déjà rasterisés, leurs pages mises en commun dans les mêmes appels modèle.
+    on_page(doc, index, text) est appelé dès qu'une tranche sort du modèle, et
+    on_doc(doc, pages_text) dès la dernière page d'un document : un PDF court
+    n'attend pas les PDF longs du même lot.
+    Retourne une liste alignée sur docs : textes des pages ou Exception.
+    """
+    results = [d if isinstance(d, Exception) else [None] * len(d) for d in docs]
+    remaining = [0 if isinstance(d, Exception) else len(d) for d in docs]
+    owners = [(i, index) for i, d in enumerate(docs) if not isinstance(d, Exception) for index in range(len(d))]
+    all_pages = [p for d in docs if not isinstance(d, Exception) for p in d]
+    if on_doc is not None:
+        for i, d in enumerate(docs):
+            if not isinstance(d, Exception) and not d:
+                on_doc(i, results[i])
+
+    # Par tranches de PAGE_CHUNK : le préprocesseur Doctr matérialise tous les
+    # tenseurs 3×1024×1024 float d'un appel d'un coup
+    start = 0
+    for images in _chunked(all_pages):
+        for (i, index), text in zip(owners[start:], _infer_texts(model, images)):
+            results[i][index] = text
+            remaining[i] -= 1
+            if on_page is not None:
+                on_page(i, index, text)
+            if remaining[i] == 0 and on_doc is not None:
+                on_doc(i, results[i])
+        start += len(images)
+    return results
+
+# ── Lecture stdin par lots ────────────────────────────────────────────────────
+
+_stdin_buf = b""
+
+def read_lines(max_lines, wait_ms):
+    """
+    Bloque jusqu'à avoir au moins une ligne, puis draine ce qui est déjà
+    disponible (jusqu'à max_lines) en attendant au plus wait_ms.
+    Retourne [] à EOF. Lecture directe sur le FD : pas de buffer Python
+    caché que select() ne verrait pas.
+    """
+    global _stdin_buf
+    fd = sys.stdin.fileno()
+    lines, eof = [], False
+    while True:
+        while b"\n" in _stdin_buf and len(lines) < max_lines:
+            line, _stdin_buf = _stdin_buf.split(b"\n", 1)
+            lines.append(line)
+        if len(lines) >= max_lines or eof:
+            break
+        timeout = None if not lines else wait_ms / 1000
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            break
+        chunk = os.read(fd, 1 << 16)
+        if chunk:
+            _stdin_buf += chunk
+            continue
+        eof = True
+        if _stdin_buf and len(lines) < max_lines:
+            lines.append(_stdin_buf)
+            _stdin_buf = b""
+    return lines
 
 # ── Boucle principale ─────────────────────────────────────────────────────────
 
-def main():
+Request = collections.namedtuple("Request", "id src stream key")
+
+# ── Cache de résultats (contenu du PDF → textes des pages) ────────────────────
+
+_result_cache = collections.OrderedDict()
+_result_cache_lock = threading.Lock()   # lu par le thread de préchargement, rempli par le principal
+
+def content_key(src, rotated):
+    """Empreinte des octets du PDF (+ mode rotated, qui change le résultat) ; None si cache désactivé."""
+    if RESULT_CACHE_SIZE <= 0:
+        return None
+    if isinstance(src, ShmRef):
+        with _shm_view(src) as data:   # hash directement sur le segment, sans copie
+            digest = _digest(data)
+    else:
+        with open(src, "rb") as f:
+            digest = _digest(f.read())
+    return f"{int(rotated)}:{digest}"
+
+def _digest(data):
+    return xxhash.xxh3_128_hexdigest(data) if xxhash is not None else hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def cache_get(key):
+    if key is None:
+        return None
+    with _result_cache_lock:
+        if key not in _result_cache:
+            return None
+        _result_cache.move_to_end(key)
+        return _result_cache[key]
+
+def cache_put(key, pages_text):
+    if key is None:
+        return
+    with _result_cache_lock:
+        _result_cache[key] = tuple(pages_text)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+# ── Réponses ──────────────────────────────────────────────────────────────────
+
+def _page_emitter(req_id):
+    def on_page(index, text):
+        emit({"id": req_id, "partial": True, "page": index, "text": text})
+    return on_page
+
+def _emit_result(req, pages_text):
+    cache_put(req.key, pages_text)
+    if req.stream:
+        emit({"id": req.id, "done": True, "page_count": len(pages_text)})
+    else:
+        emit(result_message(req.id, _join_pages(pages_text), len(pages_text), isinstance(req.src, ShmRef)))
+
+def run_requests(model, reqs, docs):
+    """
+    OCR d'une liste de Request avec un même predictor. docs : PageStream
+    (requête seule, pages livrées au fil de l'eau) ou liste alignée sur reqs.
+    """
+    # Une seule requête → chemin simple, sans découpage
+    if len(reqs) == 1:
+        req = reqs[0]
+        try:
+            if isinstance(docs, PageStream):
+                chunks = docs
+            elif isinstance(docs[0], Exception):
+                raise docs[0]
+            else:
+                chunks = _chunked(docs[0])
+            on_page = _page_emitter(req.id) if req.stream else None
+            _emit_result(req, ocr_pages(model, chunks, on_page))
+        except Exception as e:
+            print(traceback.format_exc(), file=sys.stderr, flush=True)
+            emit({"id": req.id, "error": str(e)})
+            if isinstance(docs, PageStream):
+                docs.drain()
+        return
+
+    # Chaque requête est répondue dès que sa dernière page sort du modèle
+    answered = set()
+
+    def on_page(i, index, text):
+        if reqs[i].stream:
+            emit({"id": reqs[i].id, "partial": True, "page": index, "text": text})
+
+    def on_doc(i, pages_text):
+        answered.add(i)
+        # Une réponse qui échoue ne doit pas priver les autres requêtes du lot de la leur
+        try:
+            _emit_result(reqs[i], pages_text)
+        except Exception as e:
+            print(traceback.format_exc(), file=sys.stderr, flush=True)
+            emit({"id": reqs[i].id, "error": str(e)})
+
+    for i, (req, doc) in enumerate(zip(reqs, docs)):
+        if isinstance(doc, Exception):
+            answered.add(i)
+            emit({"id": req.id, "error": str(doc)})
     try:
-        model, DocumentFile = load_model()
+        ocr_batch(model, docs, on_page, on_doc)
     except Exception as e:
-        emit({"ready": False, "error": f"Model load failed: {e}"})
-        sys.exit(1)
+        print(traceback.format_exc(), file=sys.stderr, flush=True)
+        for i, req in enumerate(reqs):
+            if i not in answered:
+                emit({"id": req.id, "error": str(e)})
 
-    emit({"ready": True})
+def _emit_all(req, pages_text):
+    """Résultat déjà complet (cache) : pages en streaming si demandé, puis réponse."""
+    if req.stream:
+        on_page = _page_emitter(req.id)
+        for index, text in enumerate(pages_text):
+            on_page(index, text)
+    _emit_result(req, pages_text)
 
-    for raw_line in sys.stdin:
+def parse_requests(raw_lines):
+    """Lignes stdin → {rotated: [Request]} ; erreurs et hits du cache répondus directement."""
+    reqs = {False: [], True: []}
+    for raw_line in raw_lines:
         raw_line = raw_line.strip()
         if not raw_line:
             continue
         req_id = None
         try:
-            req = json.loads(raw_line)
+            req = parse_request(raw_line)
             req_id = req.get("id")
-            text, page_count = ocr_pdf(model, DocumentFile, req["pdf_path"])
-            emit({"id": req_id, "text": text, "page_count": page_count})
+            rotated = bool(req.get("rotated", False))
+            src = request_source(req)
+            request = Request(req_id, src, bool(req.get("stream", False)), content_key(src, rotated))
+            # PDF déjà traité : réponse immédiate, aucun passage par Doctr
+            cached = cache_get(request.key)
+            if cached is not None:
+                _emit_all(request, cached)
+                continue
+            reqs[rotated].append(request)
         except json.JSONDecodeError as e:
             emit({"id": req_id, "error": f"Invalid JSON: {e}"})
         except KeyError as e:
             emit({"id": req_id, "error": f"Missing field: {e}"})
         except Exception as e:
-            _orig_print(traceback.format_exc(), file=sys.stderr, flush=True)
             emit({"id": req_id, "error": str(e)})
+    return reqs
+
+def prefetch_loop(DocumentFile, out_queue):
+    """
+    Thread de préchargement : lit stdin, parse, rasterise, puis dépose
+    (rotated, [Request], docs, slots) dans une file bornée. Pendant que le thread
+    principal fait tourner le modèle, le lot suivant est déjà décodé en mémoire ;
+    file pleine → on arrête de lire stdin (backpressure vers Node).
+    Une requête seule passe par un PageStream déposé AVANT la rasterisation :
+    le modèle consomme ses pages par tranches pendant que les suivantes sont rendues.
+    """
+    while True:
+        raw_lines = read_lines(BATCH_MAX, BATCH_WAIT_MS)
+        if not raw_lines:
+            out_queue.put(None)
+            return
+        try:
+            for rotated, group in parse_requests(raw_lines).items():
+                if not group:
+                    continue
+                if len(group) == 1 and _pdf_pool is not None:
+                    stream = PageStream()
+                    out_queue.put((rotated, group, stream, []))
+                    stream.produce(group[0].src)
+                    continue
+                docs, slots = load_pdfs(DocumentFile, [r.src for r in group])
+                out_queue.put((rotated, group, docs, slots))
+        except Exception:
+            print(traceback.format_exc(), file=sys.stderr, flush=True)
+
+def main():
+    setup_process()
+    try:
+        models, DocumentFile = load_model()
+    except Exception as e:
+        emit({"ready": False, "error": f"Model load failed: {e}"})
+        sys.exit(1)
+
+    emit({"ready": True})
+
+    prefetched = queue.Queue(maxsize=PREFETCH_DEPTH)
+    threading.Thread(target=prefetch_loop, args=(DocumentFile, prefetched), name="prefetch", daemon=True).start()
+
+    while True:
+        item = prefetched.get()
+        if item is None:
+            break
+        rotated, group, docs, slots = item
+        try:
+            run_requests(models[rotated], group, docs)
+        finally:
+            # Les vues sur les slots ne servent plus : réutilisables par le lot suivant
+            release_slots(slots)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
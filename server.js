@@ -3,6 +3,7 @@ import multer from "multer";
 import os from "os";
 import path from "path";
 import fs from "fs/promises";
+import { existsSync } from "fs";
 import { spawn } from "child_process";
 import { randomBytes } from "crypto";
 import readline from "readline";
@@ -15,13 +16,29 @@ const OCR_TIMEOUT_MS = Number(process.env.OCR_TIMEOUT_MS) || 60_000;
 const WORKER_READY_TIMEOUT = Number(process.env.WORKER_READY_TIMEOUT) || 120_000;
 const QUEUE_MAX_SIZE = Number(process.env.QUEUE_MAX_SIZE) || 50;
 
+// Requêtes envoyées simultanément à un même worker. 1 (défaut) = strictement
+// séquentiel : le batching entre requêtes et le préchargement côté Python
+// (rasterisation de la requête suivante pendant l'inférence) n'ont d'effet
+// qu'à partir de 2. Contrepartie : OCR_TIMEOUT_MS court dès l'envoi, donc une
+// requête en attente derrière une autre dans le worker consomme son budget,
+// et reste liée à ce worker même si un autre se libère avant. À relever pour
+// des PDF courts et nombreux, pas pour des documents longs. Les workers
+// inactifs restent servis en priorité (voir WorkerPool.#freeWorker).
+const WORKER_INFLIGHT = Number(process.env.WORKER_INFLIGHT) || 1;
+
 // Nombre de workers Python en parallèle.
 // Règle : 1 worker ≈ 1-1.5 GB RAM (torch + modèle).
 // Défaut : nb de CPU logiques, plafonné à 4.
 const WORKER_COUNT = Number(process.env.WORKER_COUNT) || Math.min(os.cpus().length, 4);
 
+// PDF transmis au worker via shared memory POSIX (/dev/shm, tmpfs) plutôt que
+// via un fichier temporaire. OCR_SHM=0 pour forcer le fichier.
+const SHM_DIR = "/dev/shm";
+const USE_SHM = process.env.OCR_SHM !== "0" && existsSync(SHM_DIR);
+
 const WORKER_PATH = new URL("ocr_worker.py", import.meta.url).pathname;
 const PDF_MAGIC = Buffer.from([0x25, 0x50, 0x44, 0x46]);
+const PAGE_SEP = "\n\n--- PAGE BREAK ---\n\n";   // identique à ocr_worker.py
 
 const SUPPORTED_LANGS = new Set([
     "fra", "eng", "deu", "spa", "ita", "por", "nld",
@@ -44,7 +61,6 @@ class PythonWorker {
     #rl = null;
     #pending = new Map();     // reqId → { resolve, reject, timer }
     #ready = false;
-    #busy = false;
     #_resolveReady;
     #_rejectReady;
     #readyPromise;
@@ -57,7 +73,8 @@ class PythonWorker {
 
     get id() { return this.#id; }
     get ready() { return this.#ready; }
-    get busy() { return this.#busy; }
+    get busy() { return this.#pending.size >= WORKER_INFLIGHT; }
+    get load() { return this.#pending.size; }
 
     start() {
         this.#ready = false;
@@ -68,7 +85,11 @@ class PythonWorker {
 
         this.#proc = spawn("python3", ["-u", WORKER_PATH], {
             stdio: ["pipe", "pipe", "pipe"],
-            env: { ...process.env, PYTHONUNBUFFERED: "1", TF_CPP_MIN_LOG_LEVEL: "3", DOCTR_MULTIPROCESSING_DISABLE: "TRUE" },
+            env: {
+                ...process.env, PYTHONUNBUFFERED: "1", TF_CPP_MIN_LOG_LEVEL: "3", DOCTR_MULTIPROCESSING_DISABLE: "TRUE",
+                // Chaque worker prend sa part disjointe des cœurs (threads, et affinité si OCR_PIN_CPUS=1)
+                OCR_WORKER_INDEX: String(this.#id), OCR_WORKER_COUNT: String(WORKER_COUNT),
+            },
         });
 
         this.#proc.stderr.on("data", (d) =>
@@ -88,7 +109,6 @@ class PythonWorker {
         this.#proc.once("close", (code) => {
             clearTimeout(readyTimer);
             this.#ready = false;
-            this.#busy = false;
             log("error", `worker-${this.#id} exited`, { code });
 
             for (const [, { reject: rej, timer }] of this.#pending) {
@@ -132,29 +152,56 @@ class PythonWorker {
         }
 
         const pending = this.#pending.get(msg.id);
-        if (!pending) return;
+        if (!pending) {
+            // Requête expirée : ne pas laisser traîner le segment de réponse
+            if (msg.shm_name) fs.rm(path.join(SHM_DIR, path.basename(msg.shm_name)), { force: true }).catch(() => { });
+            return;
+        }
+
+        // Streaming : page prête, la requête reste en cours jusqu'au terminateur "done"
+        if (msg.partial) {
+            pending.pages.push(msg.text ?? "");
+            pending.onPage?.({ page: msg.page, text: msg.text ?? "" });
+            return;
+        }
+
         clearTimeout(pending.timer);
         this.#pending.delete(msg.id);
-        this.#busy = false;
         this.#pool.onWorkerFree(this.#id);
 
         if (msg.error) pending.reject(new Error(msg.error));
+        else if (msg.done) pending.resolve({ text: pending.pages.join(PAGE_SEP).trim(), page_count: msg.page_count ?? null });
+        else if (msg.shm_name) {
+            readShmText(msg.shm_name, msg.shm_size)
+                .then(text => pending.resolve({ text, page_count: msg.page_count ?? null }))
+                .catch(pending.reject);
+        }
         else pending.resolve({ text: msg.text ?? "", page_count: msg.page_count ?? null });
     }
 
-    async ocr(pdfPath) {
+    // input : { pdf_path } ou { shm_name, shm_size }, ou fonction async qui le
+    // produit — appelée ici, au dispatch, une fois la place réservée sur ce worker
+    // onPage({ page, text }) : si fourni, le worker renvoie chaque page dès qu'elle est prête
+    async ocr(input, { rotated = false, onPage = null } = {}) {
         await this.#readyPromise;
         const id = randomBytes(8).toString("hex");
         return new Promise((resolve, reject) => {
-            const timer = setTimeout(() => {
+            const fail = (err) => {
+                const pending = this.#pending.get(id);
+                if (!pending) return;
+                clearTimeout(pending.timer);
                 this.#pending.delete(id);
-                this.#busy = false;
                 this.#pool.onWorkerFree(this.#id);
-                reject(new Error(`OCR timed out after ${OCR_TIMEOUT_MS}ms`));
-            }, OCR_TIMEOUT_MS);
-            this.#busy = true;
-            this.#pending.set(id, { resolve, reject, timer });
-            this.#proc.stdin.write(JSON.stringify({ id, pdf_path: pdfPath }) + "\n");
+                reject(err);
+            };
+            const timer = setTimeout(() => fail(new Error(`OCR timed out after ${OCR_TIMEOUT_MS}ms`)), OCR_TIMEOUT_MS);
+            this.#pending.set(id, { resolve, reject, timer, onPage, pages: [] });
+            Promise.resolve(typeof input === "function" ? input() : input)
+                .then((src) => {
+                    if (!this.#pending.has(id)) return;
+                    this.#proc.stdin.write(JSON.stringify({ id, ...src, rotated, stream: Boolean(onPage) }) + "\n");
+                })
+                .catch(fail);
         });
     }
 
@@ -167,7 +214,7 @@ class PythonWorker {
 
 class WorkerPool {
     #workers = [];
-    #queue = [];          // { pdfPath, resolve, reject, timer, reqId }
+    #queue = [];          // { input, opts, resolve, reject, timer, reqId }
     #restarting = new Set();
 
     async init(count) {
@@ -224,26 +271,35 @@ class WorkerPool {
     }
 
     #drainQueue() {
-        for (const worker of this.#workers) {
-            if (!worker.busy && worker.ready && this.#queue.length > 0) {
-                const job = this.#queue.shift();
-                clearTimeout(job.queueTimer);
-                this.#dispatch(worker, job);
-            }
+        let worker;
+        while (this.#queue.length > 0 && (worker = this.#freeWorker())) {
+            const job = this.#queue.shift();
+            clearTimeout(job.queueTimer);
+            this.#dispatch(worker, job);
+        }
+    }
+
+    // Worker prêt le moins chargé : un worker inactif passe avant un second
+    // envoi vers un worker déjà occupé
+    #freeWorker() {
+        let best = null;
+        for (const w of this.#workers) {
+            if (w.ready && !w.busy && (!best || w.load < best.load)) best = w;
         }
+        return best;
     }
 
     #dispatch(worker, job) {
-        worker.ocr(job.pdfPath)
+        worker.ocr(job.input, job.opts)
             .then(job.resolve)
             .catch(job.reject);
     }
 
-    async run(pdfPath, reqId) {
+    async run(input, reqId, opts = {}) {
         // Chercher un worker libre
-        const freeWorker = this.#workers.find(w => w.ready && !w.busy);
+        const freeWorker = this.#freeWorker();
         if (freeWorker) {
-            return freeWorker.ocr(pdfPath);
+            return freeWorker.ocr(input, opts);
         }
 
         // Tous occupés → mise en queue
@@ -260,7 +316,7 @@ class WorkerPool {
                 reject(new Error(`Job queued too long (>${OCR_TIMEOUT_MS}ms)`));
             }, OCR_TIMEOUT_MS);
 
-            this.#queue.push({ pdfPath, resolve, reject, queueTimer, reqId });
+            this.#queue.push({ input, opts, resolve, reject, queueTimer, reqId });
         });
     }
 
@@ -280,6 +336,10 @@ function isPdfBuffer(buf) {
     return buf.length >= 4 && buf.slice(0, 4).equals(PDF_MAGIC);
 }
 
+function queryFlag(value) {
+    return ["1", "true"].includes(String(value || "").toLowerCase());
+}
+
 function sanitizeLang(raw) {
     const lang = raw.toString().toLowerCase().trim();
     if (!SUPPORTED_LANGS.has(lang)) {
@@ -293,14 +353,51 @@ function sanitizeLang(raw) {
 
 // ─── OCR pipeline ─────────────────────────────────────────────────────────────
 
-async function runOcr({ buffer, reqId }) {
-    const tmpDir = await fs.mkdtemp(path.join(os.tmpdir(), "ocr-"));
-    const inPdf = path.join(tmpDir, "input.pdf");
+// Texte de réponse volumineux écrit par le worker en shared memory : lecture puis suppression
+async function readShmText(name, size) {
+    const shmPath = path.join(SHM_DIR, path.basename(name));
     try {
+        const buf = await fs.readFile(shmPath);
+        return buf.subarray(0, size).toString("utf8");
+    } finally {
+        fs.rm(shmPath, { force: true }).catch(() => { });
+    }
+}
+
+async function runOcr({ buffer, reqId, rotated, onPage }) {
+    const cleanups = [];
+    let written = null;
+
+    // Écrit au dispatch (PythonWorker.ocr) et non à l'upload : un job en file
+    // n'occupe ni /dev/shm ni le disque. /dev/shm plein → fichier temporaire.
+    const writeInput = async () => {
+        if (USE_SHM) {
+            const shmName = `ocr_${randomBytes(8).toString("hex")}`;
+            const shmPath = path.join(SHM_DIR, shmName);
+            cleanups.push(() => fs.rm(shmPath, { force: true }));
+            try {
+                await fs.writeFile(shmPath, buffer);
+                return { shm_name: shmName, shm_size: buffer.length };
+            } catch (err) {
+                if (err.code !== "ENOSPC") throw err;
+                fs.rm(shmPath, { force: true }).catch(() => { });
+                log("warn", "/dev/shm full, falling back to temp file", { reqId, size: buffer.length });
+            }
+        }
+        const tmpDir = await fs.mkdtemp(path.join(os.tmpdir(), "ocr-"));
+        cleanups.push(() => fs.rm(tmpDir, { recursive: true, force: true }));
+        const inPdf = path.join(tmpDir, "input.pdf");
         await fs.writeFile(inPdf, buffer);
-        return await pool.run(inPdf, reqId);
+        return { pdf_path: inPdf };
+    };
+
+    try {
+        return await pool.run(() => (written = writeInput()), reqId, { rotated, onPage });
     } finally {
-        fs.rm(tmpDir, { recursive: true, force: true }).catch(() => { });
+        // Après un timeout l'écriture peut être encore en cours : on l'attend avant de supprimer
+        Promise.resolve(written).catch(() => { }).finally(() => {
+            for (const cleanup of cleanups) cleanup().catch(() => { });
+        });
     }
 }
 
@@ -336,9 +433,29 @@ app.post("/ocr", upload.single("file"), async (req, res) => {
     try { lang = sanitizeLang(req.query.lang || "fra"); }
     catch (e) { return res.status(e.status || 400).json({ error: e.message }); }
 
+    // ?rotated=true : CNI / photos → détection d'orientation + redressement.
+    // Par défaut : PDF natifs, pages supposées droites (chemin rapide).
+    const rotated = queryFlag(req.query.rotated);
+
     const t0 = Date.now();
+
+    // ?stream=true : réponse NDJSON, une ligne { page, text } par page puis { done, page_count }
+    if (queryFlag(req.query.stream)) {
+        res.status(200).type("application/x-ndjson");
+        const onPage = (p) => res.write(JSON.stringify(p) + "\n");
+        try {
+            const result = await runOcr({ buffer: req.file.buffer, reqId, rotated, onPage });
+            log("info", "ocr done", { reqId, pages: result.page_count, chars: result.text.length, ms: Date.now() - t0, stream: true });
+            res.end(JSON.stringify({ done: true, page_count: result.page_count }) + "\n");
+        } catch (e) {
+            log("error", "ocr failed", { reqId, error: e.message, ms: Date.now() - t0, stream: true });
+            res.end(JSON.stringify({ error: e.message }) + "\n");
+        }
+        return;
+    }
+
     try {
-        const result = await runOcr({ buffer: req.file.buffer, reqId });
+        const result = await runOcr({ buffer: req.file.buffer, reqId, rotated });
         log("info", "ocr done", { reqId, pages: result.page_count, chars: result.text.length, ms: Date.now() - t0 });
         res.json(result);
     } catch (e) {
@@ -360,7 +477,7 @@ app.use((err, _req, res, _next) => {
 pool.init(WORKER_COUNT)
     .then(() => {
         app.listen(PORT, () =>
-            log("info", `OCR service listening on :${PORT}`, { workers: WORKER_COUNT, engine: "doctr-pool" })
+            log("info", `OCR service listening on :${PORT}`, { workers: WORKER_COUNT, engine: "doctr-pool", shm: USE_SHM })
         );
     })
     .catch((e) => {
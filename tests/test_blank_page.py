@@ -0,0 +1,60 @@
+"""Détection des pages blanches sur des pages synthétiques : python -m unittest discover tests"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+H, W = 1684, 1190   # A4 à 144 dpi
+
+
+def page(background=235):
+    return np.full((H, W, 3), background, dtype=np.uint8)
+
+
+def noisy_scan(seed=0):
+    """Fond grisé, grain gaussien, quelques poussières isolées."""
+    rng = np.random.default_rng(seed)
+    image = np.clip(rng.normal(228, 7, (H, W, 1)), 0, 255).astype(np.uint8).repeat(3, axis=2)
+    for y, x in rng.integers(0, (H - 2, W - 2), size=(8, 2)):
+        image[y:y + 2, x:x + 2] = 40
+    return image
+
+
+def write_word(image, y, x, letters=3, ink=20):
+    """Lettres de 14×9 px à traits de 2 px, comme un corps 10 pt à 144 dpi."""
+    for i in range(letters):
+        left = x + i * 12
+        image[y:y + 14, left:left + 2] = ink
+        image[y:y + 14, left + 7:left + 9] = ink
+        image[y + 6:y + 8, left:left + 9] = ink
+    return image
+
+
+class BlankPageTest(unittest.TestCase):
+
+    def test_white_page_blank(self):
+        self.assertTrue(ocr_worker._is_blank(page()))
+
+    def test_noisy_scan_blank(self):
+        for seed in range(3):
+            self.assertTrue(ocr_worker._is_blank(noisy_scan(seed)), seed)
+
+    def test_sparse_text_kept(self):
+        # Un seul numéro de page court, dans un coin, sur un scan bruité
+        self.assertFalse(ocr_worker._is_blank(write_word(noisy_scan(), H - 60, W - 80, letters=2)))
+
+    def test_light_text_on_dark_background_kept(self):
+        self.assertFalse(ocr_worker._is_blank(write_word(page(background=25), 100, 100, ink=230)))
+
+    def test_disabled(self):
+        with mock.patch.object(ocr_worker, "BLANK_INK", 0):
+            self.assertFalse(ocr_worker._is_blank(page()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Réouverture des PDF côté enfant du pool et empreinte shm : python -m unittest discover tests"""
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+from multiprocessing import shared_memory
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+class FakeDoc:
+    def __init__(self, src):
+        self.src = src
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ChildOpenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.opened = []
+        patchers = [
+            mock.patch.object(ocr_worker, "_child_doc", None),
+            mock.patch.object(ocr_worker, "_fitz_open", self.fitz_open),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fitz_open(self, src):
+        self.opened.append(FakeDoc(src))
+        return self.opened[-1]
+
+    def test_same_source_opened_once(self):
+        ref = ocr_worker.ShmRef("ocr_a", 10)
+        docs = {id(ocr_worker._child_open(ref)) for _ in range(5)}
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_new_source_closes_previous(self):
+        first = ocr_worker._child_open(ocr_worker.ShmRef("ocr_a", 10))
+        ocr_worker._child_open(ocr_worker.ShmRef("ocr_b", 10))
+        self.assertTrue(first.closed)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_rewritten_path_reopened(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "input.pdf")
+            with open(path, "wb") as f:
+                f.write(b"one")
+            ocr_worker._child_open(path)
+            with open(path, "wb") as f:
+                f.write(b"second")
+            ocr_worker._child_open(path)
+        self.assertEqual(len(self.opened), 2)
+
+
+@unittest.skipUnless(os.path.isdir("/dev/shm"), "POSIX shm requis")
+class ShmContentKeyTest(unittest.TestCase):
+
+    def test_key_hashes_segment_bytes(self):
+        data = b"%PDF-1.7 fake"
+        shm = shared_memory.SharedMemory(create=True, size=len(data) + 16)
+        self.addCleanup(shm.unlink)
+        self.addCleanup(shm.close)
+        shm.buf[:len(data)] = data
+        ref = ocr_worker.ShmRef(shm.name, len(data))
+        with mock.patch.object(ocr_worker, "xxhash", None), mock.patch.object(ocr_worker, "RESULT_CACHE_SIZE", 8):
+            key = ocr_worker.content_key(ref, True)
+        self.assertEqual(key, "1:" + hashlib.blake2b(data, digest_size=16).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
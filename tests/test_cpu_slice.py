@@ -0,0 +1,42 @@
+"""Partage des cœurs entre workers : python -m unittest discover tests"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+def slices(cpus, count):
+    result = []
+    for index in range(count):
+        env = {"OCR_WORKER_COUNT": str(count), "OCR_WORKER_INDEX": str(index)}
+        with mock.patch.dict(os.environ, env), \
+                mock.patch.object(ocr_worker.os, "sched_getaffinity", lambda pid: set(cpus), create=True):
+            result.append(ocr_worker._cpu_slice())
+    return result
+
+
+class CpuSliceTest(unittest.TestCase):
+
+    def test_disjoint_and_complete(self):
+        for n_cpus in range(1, 17):
+            for count in range(1, min(n_cpus, 6) + 1):
+                parts = slices(range(n_cpus), count)
+                flat = [cpu for part in parts for cpu in part]
+                self.assertEqual(sorted(flat), list(range(n_cpus)), (n_cpus, count))
+                self.assertLessEqual(max(map(len, parts)) - min(map(len, parts)), 1)
+
+    def test_leftover_cores_go_to_first_workers(self):
+        self.assertEqual(slices(range(7), 4), [[0, 1], [2, 3], [4, 5], [6]])
+
+    def test_respects_affinity_mask(self):
+        self.assertEqual(slices([2, 3, 8, 9, 10], 2), [[2, 3, 8], [9, 10]])
+
+    def test_more_workers_than_cores(self):
+        self.assertEqual(slices([0, 1], 3), [[0], [1], [0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
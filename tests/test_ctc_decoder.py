@@ -0,0 +1,69 @@
+"""DeviceCTCDecoder face au CTCPostProcessor de Doctr : python -m unittest discover tests"""
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+try:
+    import torch
+except ImportError:   # sans torch : test ignoré
+    torch = None
+
+VOCAB = "abc0123"
+
+
+def reference_decoder(vocab):
+    """CTCPostProcessor de Doctr s'il est installé, sinon sa logique best-path recopiée."""
+    try:
+        from doctr.models.recognition.crnn.pytorch import CTCPostProcessor
+        return CTCPostProcessor(vocab=vocab)
+    except ImportError:
+        pass
+
+    def decode(logits):
+        blank = len(vocab)
+        probs = torch.softmax(logits, -1).max(dim=-1).values.min(dim=1).values
+        words = [
+            "".join(vocab[k] for k, _ in itertools.groupby(seq.tolist()) if k != blank)
+            for seq in torch.argmax(logits, -1)
+        ]
+        return list(zip(words, probs.tolist()))
+    return decode
+
+
+@unittest.skipIf(torch is None, "torch requis")
+class DeviceCTCDecoderTest(unittest.TestCase):
+
+    def assertSameDecoding(self, logits):
+        expected = reference_decoder(VOCAB)(logits)
+        actual = ocr_worker.DeviceCTCDecoder(VOCAB)(logits)
+        self.assertEqual([w for w, _ in actual], [w for w, _ in expected])
+        for (_, p_actual), (_, p_expected) in zip(actual, expected):
+            self.assertAlmostEqual(p_actual, p_expected, places=5)
+
+    def one_hot(self, seqs):
+        logits = torch.full((len(seqs), len(seqs[0]), len(VOCAB) + 1), -5.0)
+        for b, seq in enumerate(seqs):
+            for t, k in enumerate(seq):
+                logits[b, t, k] = 5.0
+        return logits
+
+    def test_repeats_and_blanks(self):
+        blank = len(VOCAB)
+        # "aab" → "ab" ; "a<blank>a" → "aa" ; tout blank → ""
+        self.assertSameDecoding(self.one_hot([
+            [0, 0, blank, 1, 1, blank],
+            [0, blank, 0, blank, blank, blank],
+            [blank] * 6,
+        ]))
+
+    def test_random_logits(self):
+        generator = torch.Generator().manual_seed(0)
+        self.assertSameDecoding(torch.randn((16, 32, len(VOCAB) + 1), generator=generator) * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
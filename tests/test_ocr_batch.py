@@ -0,0 +1,84 @@
+"""Lots multi-requêtes : découpage par requête et réponses au fil des tranches : python -m unittest discover tests"""
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+def doc(name, pages):
+    return [f"{name}{i}" for i in range(pages)]
+
+
+class BatchTest(unittest.TestCase):
+    """Modèle factice : le texte d'une page est son nom ; events garde l'ordre appels modèle / réponses."""
+
+    def setUp(self):
+        self.events = []
+        self.fail_on_call = None
+        patchers = [
+            mock.patch.object(ocr_worker, "PAGE_CHUNK", 4),
+            mock.patch.object(ocr_worker, "_infer_texts", self.infer_texts),
+            mock.patch.object(ocr_worker, "emit", lambda msg: self.events.append(msg)),
+            mock.patch.object(ocr_worker.sys, "stderr", io.StringIO()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def infer_texts(self, model, images):
+        calls = sum(1 for e in self.events if e == "model")
+        if calls == self.fail_on_call:
+            raise RuntimeError("model failed")
+        self.events.append("model")
+        return [f"text-{image}" for image in images]
+
+    def test_results_split_per_document(self):
+        error = ValueError("corrupt")
+        results = ocr_worker.ocr_batch(None, [doc("a", 1), error, doc("b", 10), []])
+        self.assertEqual(results[0], ["text-a0"])
+        self.assertIs(results[1], error)
+        self.assertEqual(results[2], [f"text-b{i}" for i in range(10)])
+        self.assertEqual(results[3], [])
+
+    def test_short_document_done_after_its_chunk(self):
+        ocr_worker.ocr_batch(None, [doc("a", 1), doc("b", 10)],
+                             on_doc=lambda i, pages: self.events.append(("done", i, list(pages))))
+        done = [e for e in self.events if e != "model"]
+        self.assertEqual(self.events[:2], ["model", ("done", 0, ["text-a0"])])
+        self.assertEqual(done[-1][:2], ("done", 1))
+        self.assertEqual(self.events.count("model"), 3)
+
+    def test_run_requests_answers_each_request_when_ready(self):
+        reqs = [
+            ocr_worker.Request("a", "a.pdf", True, None),
+            ocr_worker.Request("b", "b.pdf", False, None),
+            ocr_worker.Request("c", "c.pdf", False, None),
+        ]
+        ocr_worker.run_requests(None, reqs, [doc("a", 2), doc("b", 10), ValueError("corrupt")])
+        self.assertEqual(self.events[:5], [
+            {"id": "c", "error": "corrupt"},
+            "model",
+            {"id": "a", "partial": True, "page": 0, "text": "text-a0"},
+            {"id": "a", "partial": True, "page": 1, "text": "text-a1"},
+            {"id": "a", "done": True, "page_count": 2},
+        ])
+        self.assertEqual(self.events[-1]["id"], "b")
+        self.assertIn("text-b9", self.events[-1]["text"])
+
+    def test_model_error_only_fails_unanswered_requests(self):
+        self.fail_on_call = 1
+        reqs = [ocr_worker.Request("a", "a.pdf", False, None), ocr_worker.Request("b", "b.pdf", False, None)]
+        ocr_worker.run_requests(None, reqs, [doc("a", 1), doc("b", 10)])
+        replies = [e for e in self.events if e != "model"]
+        self.assertEqual(replies, [
+            {"id": "a", "text": "text-a0", "page_count": 1},
+            {"id": "b", "error": "model failed"},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
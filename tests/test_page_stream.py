@@ -0,0 +1,104 @@
+"""PageStream avec un pool de rasterisation factice : python -m unittest discover tests"""
+import io
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+class FakePool:
+    """imap synchrone ; la page fail_at lève comme un PDF impossible à rendre."""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+
+    def imap(self, func, tasks):
+        for src, page_idx, slot in tasks:
+            if page_idx == self.fail_at:
+                raise RuntimeError(f"cannot render page {page_idx}")
+            yield [f"{src}-p{page_idx}"]
+
+
+class PageStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        for name, value in (("_page_slots", None), ("PAGE_CHUNK", 4)):
+            patcher = mock.patch.object(ocr_worker, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self, page_count, pool):
+        stream = ocr_worker.PageStream()
+        with mock.patch.object(ocr_worker, "_pdf_pool", pool), \
+                mock.patch.object(ocr_worker, "_page_count", lambda src: page_count):
+            stream.produce("doc")
+        return stream
+
+    def run_bounded(self, func):
+        """func() dans un thread ; échoue au lieu de bloquer la suite si elle ne rend pas la main."""
+        result = {}
+
+        def target():
+            try:
+                result["value"] = func()
+            except Exception as e:
+                result["error"] = e
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(2)
+        self.assertFalse(thread.is_alive(), "blocked")
+        return result
+
+    def test_pages_arrive_in_chunks(self):
+        stream = self.stream(10, FakePool())
+        chunks = [[page[0] for page in images] for images in stream]
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        self.assertEqual(chunks[2], ["doc-p8", "doc-p9"])
+
+    def test_rasterisation_error_reaches_consumer_then_drain_returns(self):
+        stream = self.stream(10, FakePool(fail_at=5))
+        seen = []
+        with self.assertRaisesRegex(RuntimeError, "page 5"):
+            for images in stream:
+                seen.append(len(images))
+        self.assertEqual(seen, [4])
+        self.assertNotIn("error", self.run_bounded(stream.drain))
+
+    def test_page_count_error_then_drain_returns(self):
+        stream = ocr_worker.PageStream()
+        with mock.patch.object(ocr_worker, "_pdf_pool", FakePool()), \
+                mock.patch.object(ocr_worker, "_page_count", side_effect=ValueError("encrypted")):
+            stream.produce("doc")
+        with self.assertRaisesRegex(ValueError, "encrypted"):
+            list(stream)
+        self.assertNotIn("error", self.run_bounded(stream.drain))
+
+    def test_run_requests_replies_with_error_and_returns(self):
+        stream = ocr_worker.PageStream()
+        with mock.patch.object(ocr_worker, "_pdf_pool", FakePool()), \
+                mock.patch.object(ocr_worker, "_page_count", side_effect=ValueError("encrypted")):
+            stream.produce("doc")
+        req = ocr_worker.Request("r1", "doc", False, None)
+        with mock.patch.object(ocr_worker, "emit") as emit, \
+                mock.patch.object(ocr_worker.sys, "stderr", io.StringIO()):
+            result = self.run_bounded(lambda: ocr_worker.run_requests(object(), [req], stream))
+        self.assertNotIn("error", result)
+        emit.assert_called_once_with({"id": "r1", "error": "encrypted"})
+
+    def test_drain_after_inference_error_releases_every_slot(self):
+        released = []
+        stream = self.stream(10, FakePool())
+        with mock.patch.object(ocr_worker, "release_slots", released.extend):
+            pages = iter(stream)
+            next(pages)
+            pages.close()   # inférence interrompue sur la première tranche
+            self.run_bounded(stream.drain)
+        self.assertEqual(len(released), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Pickle des predictors : fichier refusé s'il peut venir d'un tiers : python -m unittest discover tests"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+class PredictorCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "predictors.pt")
+        with open(self.path, "wb") as f:
+            f.write(b"not a pickle")
+        os.chmod(self.path, 0o644)
+
+    def test_default_path_is_not_tmp(self):
+        self.assertFalse(ocr_worker.PREDICTOR_CACHE.startswith(tempfile.gettempdir()))
+
+    def test_own_file_trusted(self):
+        self.assertTrue(ocr_worker._cache_file_trusted(self.path))
+
+    def test_group_or_world_writable_rejected(self):
+        for mode in (0o664, 0o646):
+            os.chmod(self.path, mode)
+            self.assertFalse(ocr_worker._cache_file_trusted(self.path), oct(mode))
+
+    def test_untrusted_file_never_loaded(self):
+        os.chmod(self.path, 0o666)
+        with mock.patch.object(ocr_worker, "PREDICTOR_CACHE", self.path), \
+                mock.patch.object(ocr_worker.sys, "stderr", io.StringIO()):
+            # Retour avant tout import de torch
+            self.assertIsNone(ocr_worker._load_cached_predictors())
+
+
+if __name__ == "__main__":
+    unittest.main()
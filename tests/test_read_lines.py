@@ -0,0 +1,54 @@
+"""read_lines() alimenté par un vrai pipe : python -m unittest discover tests"""
+import contextlib
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+class ReadLinesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.r, self.w = os.pipe()
+        self.stdin = open(self.r, "rb", buffering=0)
+        patcher = mock.patch.object(ocr_worker.sys, "stdin", self.stdin)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.stdin.close)
+        ocr_worker._stdin_buf = b""
+
+    def feed(self, data, close=False):
+        os.write(self.w, data)
+        if close:
+            os.close(self.w)
+
+    def test_several_lines_in_one_read(self):
+        self.feed(b'{"id":1}\n{"id":2}\n{"id":3}\n')
+        self.assertEqual(ocr_worker.read_lines(10, 5), [b'{"id":1}', b'{"id":2}', b'{"id":3}'])
+
+    def test_batch_cap_keeps_the_rest_buffered(self):
+        self.feed(b"a\nb\nc\nd\n", close=True)
+        self.assertEqual(ocr_worker.read_lines(3, 5), [b"a", b"b", b"c"])
+        self.assertEqual(ocr_worker.read_lines(3, 5), [b"d"])
+        self.assertEqual(ocr_worker.read_lines(3, 5), [])
+
+    def test_eof_without_trailing_newline(self):
+        self.feed(b"a\nb", close=True)
+        self.assertEqual(ocr_worker.read_lines(10, 5), [b"a", b"b"])
+        self.assertEqual(ocr_worker.read_lines(10, 5), [])
+
+    def test_line_split_across_writes(self):
+        self.feed(b'{"id"')
+        self.feed(b':1}\n', close=True)
+        self.assertEqual(ocr_worker.read_lines(10, 5), [b'{"id":1}'])
+
+    def tearDown(self):
+        with contextlib.suppress(OSError):
+            os.close(self.w)
+
+
+if __name__ == "__main__":
+    unittest.main()
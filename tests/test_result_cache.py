@@ -0,0 +1,72 @@
+"""Cache LRU des résultats : python -m unittest discover tests"""
+import collections
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(ocr_worker, "_result_cache", collections.OrderedDict()),
+            mock.patch.object(ocr_worker, "RESULT_CACHE_SIZE", 2),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_oldest_evicted(self):
+        for key in ("a", "b", "c"):
+            ocr_worker.cache_put(key, [key])
+        self.assertIsNone(ocr_worker.cache_get("a"))
+        self.assertEqual(ocr_worker.cache_get("b"), ("b",))
+        self.assertEqual(ocr_worker.cache_get("c"), ("c",))
+
+    def test_get_refreshes_entry(self):
+        ocr_worker.cache_put("a", ["a"])
+        ocr_worker.cache_put("b", ["b"])
+        ocr_worker.cache_get("a")
+        ocr_worker.cache_put("c", ["c"])
+        self.assertEqual(ocr_worker.cache_get("a"), ("a",))
+        self.assertIsNone(ocr_worker.cache_get("b"))
+
+    def test_put_refreshes_existing_key(self):
+        ocr_worker.cache_put("a", ["a"])
+        ocr_worker.cache_put("b", ["b"])
+        ocr_worker.cache_put("a", ["a2"])
+        ocr_worker.cache_put("c", ["c"])
+        self.assertEqual(ocr_worker.cache_get("a"), ("a2",))
+        self.assertIsNone(ocr_worker.cache_get("b"))
+
+    def test_stored_pages_are_immutable(self):
+        pages = ["p0"]
+        ocr_worker.cache_put("a", pages)
+        pages.append("p1")
+        self.assertEqual(ocr_worker.cache_get("a"), ("p0",))
+
+    def test_none_key_disables_cache(self):
+        ocr_worker.cache_put(None, ["a"])
+        self.assertEqual(len(ocr_worker._result_cache), 0)
+        self.assertIsNone(ocr_worker.cache_get(None))
+
+    def test_cache_hit_answers_without_model(self):
+        ocr_worker.cache_put("0:abc", ["p0", "p1"])
+        replies = []
+        with mock.patch.object(ocr_worker, "content_key", lambda src, rotated: "0:abc"), \
+                mock.patch.object(ocr_worker, "emit", replies.append):
+            groups = ocr_worker.parse_requests([b'{"id": "r1", "pdf_path": "/x.pdf", "stream": true}'])
+        self.assertEqual(groups, {False: [], True: []})
+        self.assertEqual(replies, [
+            {"id": "r1", "partial": True, "page": 0, "text": "p0"},
+            {"id": "r1", "partial": True, "page": 1, "text": "p1"},
+            {"id": "r1", "done": True, "page_count": 2},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
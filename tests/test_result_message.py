@@ -0,0 +1,66 @@
+"""Réponses texte : seuil shared memory et repli inline : python -m unittest discover tests"""
+import io
+import os
+import sys
+import unittest
+from multiprocessing import shared_memory
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import ocr_worker  # noqa: E402
+
+THRESHOLD = ocr_worker.SHM_TEXT_THRESHOLD
+
+
+class ResultMessageTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(ocr_worker.sys, "stderr", io.StringIO())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_small_text_inline(self):
+        msg = ocr_worker.result_message("r1", "a" * THRESHOLD, 1, via_shm=True)
+        self.assertEqual(msg, {"id": "r1", "text": "a" * THRESHOLD, "page_count": 1})
+
+    def test_path_request_always_inline(self):
+        msg = ocr_worker.result_message("r1", "a" * (THRESHOLD + 1), 1, via_shm=False)
+        self.assertIn("text", msg)
+
+    @unittest.skipUnless(os.path.isdir("/dev/shm"), "POSIX shm requis")
+    def test_large_text_via_shm(self):
+        text = "é" * THRESHOLD   # 2 octets UTF-8 par caractère : seuil dépassé en octets
+        msg = ocr_worker.result_message("r1", text, 3, via_shm=True)
+        self.assertNotIn("text", msg)
+        self.assertEqual(msg["shm_size"], len(text.encode("utf-8")))
+        shm = shared_memory.SharedMemory(name=msg["shm_name"])
+        try:
+            self.assertEqual(bytes(shm.buf[:msg["shm_size"]]).decode("utf-8"), text)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_shm_full_falls_back_inline(self):
+        text = "a" * (THRESHOLD + 1)
+        with mock.patch.object(ocr_worker, "_write_shm", side_effect=OSError(28, "No space left on device")):
+            msg = ocr_worker.result_message("r1", text, 1, via_shm=True)
+        self.assertEqual(msg, {"id": "r1", "text": text, "page_count": 1})
+
+    def test_failed_reply_does_not_drop_the_rest_of_the_batch(self):
+        reqs = [ocr_worker.Request(i, ocr_worker.ShmRef(f"ocr_{i}", 1), False, None) for i in ("r1", "r2")]
+        calls = []
+
+        def result_message(req_id, *args):
+            if req_id == "r1":
+                raise RuntimeError("reply failed")
+            return {"id": req_id, "text": "ok"}
+
+        with mock.patch.object(ocr_worker, "_infer_texts", lambda model, images: ["p"] * len(images)), \
+                mock.patch.object(ocr_worker, "result_message", result_message), \
+                mock.patch.object(ocr_worker, "emit", calls.append):
+            ocr_worker.run_requests(object(), reqs, [["img"], ["img"]])
+        self.assertEqual(calls, [{"id": "r1", "error": "reply failed"}, {"id": "r2", "text": "ok"}])
+
+
+if __name__ == "__main__":
+    unittest.main()